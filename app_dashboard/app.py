@@ -11,11 +11,13 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
 import geopandas as gpd
-import json
+import gzip
 import os
 from datetime import datetime
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
 import numpy as np
+import orjson
 
 # ==================== CONFIGURACIÓN DE LA PÁGINA ====================
 st.set_page_config(
@@ -80,111 +82,252 @@ st.markdown("""
 
 # ==================== FUNCIONES DE CARGA DE DATOS ====================
 
+@st.cache_resource
+def get_engine():
+    """Crea (una sola vez) el engine de SQLite y asegura el índice por ubicación y tiempo"""
+    db_path = os.path.join(os.getcwd(), 'db_1.db')
+    # El engine se comparte entre los hilos de las sesiones de Streamlit
+    engine = create_engine(f'sqlite:///{db_path}', connect_args={'check_same_thread': False})
+    
+    # Índice para que las consultas por ubicación y rango de fechas no recorran toda la tabla
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_wsd_loc_time "
+                "ON water_surface_detection_v3(loc, time)"
+            ))
+    except OperationalError:
+        # Base de datos de solo lectura: se consulta sin índice
+        pass
+    
+    return engine
+
 @st.cache_data
-def load_database():
-    """Carga la base de datos SQLite"""
+def load_locations_summary():
+    """Carga el resumen agregado por ubicación y satélite desde SQLite"""
     try:
-        db_path = os.path.join(os.getcwd(), 'db_1.db')
-        engine = create_engine(f'sqlite:///{db_path}')
-        
-        # Cargar todos los datos
         query = """
         SELECT 
             loc,
             sat_id,
-            time,
-            area_km2,
-            ndwi_area_km2
+            MIN(time) AS time_min,
+            MAX(time) AS time_max,
+            COUNT(*) AS n_obs,
+            COUNT(area_km2) AS n_area,
+            SUM(area_km2) AS sum_area,
+            MAX(area_km2) AS max_area,
+            MIN(area_km2) AS min_area
         FROM water_surface_detection_v3
         WHERE (error = 0 OR error_vis = 0)
-        ORDER BY time
+        GROUP BY loc, sat_id
         """
-        df = pd.read_sql(query, engine)
-        df['time'] = pd.to_datetime(df['time'])
+        df = pd.read_sql(query, get_engine())
+        df['time_min'] = pd.to_datetime(df['time_min'])
+        df['time_max'] = pd.to_datetime(df['time_max'])
         
         return df
     except Exception as e:
         st.error(f"Error al cargar la base de datos: {e}")
         return pd.DataFrame()
 
+@st.cache_data
+def load_daily_counts():
+    """Carga el número de observaciones por día y sensor (tabla días × sensor)"""
+    query = """
+    SELECT 
+        DATE(time) AS day,
+        SUM(sat_id = 'S1_GRD') AS sentinel1_obs,
+        SUM(sat_id != 'S1_GRD') AS landsat_obs
+    FROM water_surface_detection_v3
+    WHERE (error = 0 OR error_vis = 0)
+    GROUP BY day
+    ORDER BY day
+    """
+    df = pd.read_sql(query, get_engine())
+    df['day'] = pd.to_datetime(df['day'])
+    
+    return df.set_index('day')
+
+@st.cache_data(ttl=3600)
+def load_location_series(loc):
+    """Carga todas las observaciones de una ubicación, ordenadas por tiempo"""
+    query = """
+    SELECT 
+        loc,
+        sat_id,
+        time,
+        area_km2,
+        ndwi_area_km2
+    FROM water_surface_detection_v3
+    WHERE loc = :loc
+        AND (error = 0 OR error_vis = 0)
+    ORDER BY time
+    """
+    # Áreas en float32 y códigos enteros para los identificadores
+    df = pd.read_sql(
+        text(query),
+        get_engine(),
+        params={'loc': loc},
+        parse_dates=['time'],
+        dtype={'area_km2': 'float32', 'ndwi_area_km2': 'float32'}
+    )
+    df = df.astype({
+        'loc': 'category',
+        'sat_id': 'category'
+    })
+    
+    return df
+
+GEOJSON_EXTENSIONS = ('.geojson.gz', '.geojson')
+
 @st.cache_data
 def load_geometries():
-    """Carga todas las geometrías GeoJSON"""
+    """Localiza los archivos GeoJSON (comprimidos o no): {loc_id: ruta}"""
     try:
         geometries_path = os.path.join(os.getcwd(), 'geometries')
-        geojson_files = [f for f in os.listdir(geometries_path) if f.endswith('.geojson')]
         
         geometries = {}
-        for file in geojson_files:
-            loc_id = file.replace('.geojson', '')
-            file_path = os.path.join(geometries_path, file)
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                geojson_data = json.load(f)
-                geometries[loc_id] = geojson_data
+        for file in sorted(os.listdir(geometries_path)):
+            for ext in GEOJSON_EXTENSIONS:
+                if file.endswith(ext):
+                    geometries.setdefault(file[:-len(ext)], os.path.join(geometries_path, file))
+                    break
         
         return geometries
     except Exception as e:
         st.error(f"Error al cargar geometrías: {e}")
         return {}
 
+@st.cache_data(max_entries=64)
+def load_geometry(file_path):
+    """Lee y parsea un GeoJSON bajo demanda (cada llamada recibe su propia copia)"""
+    opener = gzip.open if file_path.endswith('.gz') else open
+    with opener(file_path, 'rb') as f:
+        return orjson.loads(f.read())
+
+def split_by_satellite(loc_data):
+    """Separa las observaciones de Sentinel-1 y Landsat con una única máscara"""
+    is_s1 = loc_data['sat_id'] == 'S1_GRD'
+    return loc_data[is_s1], loc_data[~is_s1]
+
+def get_location_data(loc_id, date_range, sat_filter):
+    """Obtiene las observaciones de una ubicación filtradas por fechas y satélites"""
+    loc_data = load_location_series(loc_id)
+    
+    # Rango de fechas como corte sobre la columna ordenada (búsqueda binaria, sin copia)
+    d0, d1 = date_range
+    start, end = loc_data['time'].searchsorted([pd.Timestamp(d0), pd.Timestamp(d1) + pd.Timedelta(days=1)])
+    loc_data = loc_data.iloc[start:end]
+    
+    # Con ambos sensores seleccionados no hace falta máscara
+    show_s1 = 'Sentinel-1' in sat_filter
+    show_landsat = 'Landsat' in sat_filter
+    if not (show_s1 or show_landsat):
+        loc_data = loc_data.iloc[:0]
+    elif not (show_s1 and show_landsat):
+        sentinel1_data, landsat_data = split_by_satellite(loc_data)
+        loc_data = sentinel1_data if show_s1 else landsat_data
+    
+    return loc_data
+
 @st.cache_data
-def create_locations_dataframe(geometries, data_df):
+def compute_centroids(geometries):
+    """Calcula el centroide y el nombre Ramsar de cada ubicación a partir de su GeoJSON"""
+    # Una fila por feature, etiquetada con el ID de su ubicación
+    features = []
+    for loc_id, file_path in geometries.items():
+        geojson = load_geometry(file_path)
+        loc_features = geojson['features'] if geojson['type'] == 'FeatureCollection' else [geojson]
+        features.extend(
+            {**feature, 'properties': {**(feature.get('properties') or {}), 'loc': loc_id}}
+            for feature in loc_features
+        )
+    gdf = gpd.GeoDataFrame.from_features(features, crs='EPSG:4326')
+    
+    # Centroide y área de cada feature (GEOS, todos los anillos), en coordenadas proyectadas
+    projected = gdf.geometry.to_crs('EPSG:3857')
+    feature_centroids = projected.centroid
+    parts = pd.DataFrame({
+        'loc': gdf['loc'].values,
+        'area': projected.area.values,
+        'x': feature_centroids.x.values,
+        'y': feature_centroids.y.values
+    })
+    
+    # Centroide de la ubicación: media de los centroides de sus features ponderada por área
+    parts['wx'] = parts['x'] * parts['area']
+    parts['wy'] = parts['y'] * parts['area']
+    sums = parts.groupby('loc', sort=False).agg(
+        area=('area', 'sum'), wx=('wx', 'sum'), wy=('wy', 'sum'), x=('x', 'mean'), y=('y', 'mean')
+    )
+    has_area = sums['area'] > 0
+    x = np.where(has_area, sums['wx'] / sums['area'].where(has_area), sums['x'])
+    y = np.where(has_area, sums['wy'] / sums['area'].where(has_area), sums['y'])
+    centroids = gpd.GeoSeries(gpd.points_from_xy(x, y), crs='EPSG:3857').to_crs('EPSG:4326')
+    
+    # Nombre Ramsar de la primera feature de cada ubicación
+    first_features = gdf.drop_duplicates('loc').set_index('loc').reindex(sums.index)
+    
+    return pd.DataFrame({
+        'loc': sums.index.values,
+        'ram_name': first_features['RAM_NAME'].fillna('N/A').values if 'RAM_NAME' in gdf else 'N/A',
+        'lat': centroids.y.values,
+        'lon': centroids.x.values
+    })
+
+@st.cache_data
+def load_centroids():
+    """Carga los centroides precalculados por scripts/build_centroids.py"""
+    centroids_path = os.path.join(os.getcwd(), 'data', 'centroids.parquet')
+    if not os.path.exists(centroids_path):
+        return pd.DataFrame()
+    
+    try:
+        return pd.read_parquet(centroids_path)
+    except Exception as e:
+        st.error(f"Error al cargar los centroides: {e}")
+        return pd.DataFrame()
+
+@st.cache_data
+def create_locations_dataframe(centroids_df, summary_df):
     """Crea un DataFrame con información de ubicaciones"""
-    locations = []
+    # Estadísticas por ubicación en una sola agrupación del resumen SQL
+    summary = summary_df.assign(
+        sentinel1_obs=summary_df['n_obs'].where(summary_df['sat_id'] == 'S1_GRD', 0)
+    )
+    stats = summary.groupby('loc', sort=False).agg(
+        total_observations=('n_obs', 'sum'),
+        sentinel1_obs=('sentinel1_obs', 'sum'),
+        n_area=('n_area', 'sum'),
+        sum_area=('sum_area', 'sum'),
+        max_area=('max_area', 'max'),
+        min_area=('min_area', 'min')
+    )
+    stats['landsat_obs'] = stats['total_observations'] - stats['sentinel1_obs']
+    stats['avg_area'] = stats['sum_area'] / stats['n_area']
     
-    for loc_id, geojson in geometries.items():
-        # Extraer coordenadas del centroide
-        if geojson['type'] == 'FeatureCollection':
-            features = geojson['features']
-        else:
-            features = [geojson]
-        
-        if features:
-            # Extraer el nombre RAM_NAME de las propiedades
-            ram_name = features[0].get('properties', {}).get('RAM_NAME', 'N/A')
-            
-            # Calcular centroide aproximado
-            coords = features[0]['geometry']['coordinates']
-            
-            if features[0]['geometry']['type'] == 'Polygon':
-                coords_array = np.array(coords[0])
-            elif features[0]['geometry']['type'] == 'MultiPolygon':
-                coords_array = np.array(coords[0][0])
-            else:
-                coords_array = np.array(coords)
-            
-            centroid_lon = np.mean(coords_array[:, 0])
-            centroid_lat = np.mean(coords_array[:, 1])
-            
-            # Obtener estadísticas de la base de datos
-            loc_data = data_df[data_df['loc'] == loc_id]
-            
-            if not loc_data.empty:
-                locations.append({
-                    'loc': loc_id,
-                    'ram_name': ram_name,
-                    'lat': centroid_lat,
-                    'lon': centroid_lon,
-                    'total_observations': len(loc_data),
-                    'sentinel1_obs': len(loc_data[loc_data['sat_id'] == 'S1_GRD']),
-                    'landsat_obs': len(loc_data[loc_data['sat_id'] != 'S1_GRD']),
-                    'avg_area': loc_data['area_km2'].mean(),
-                    'max_area': loc_data['area_km2'].max(),
-                    'min_area': loc_data['area_km2'].min()
-                })
-    
-    return pd.DataFrame(locations)
+    stats_columns = ['total_observations', 'sentinel1_obs', 'landsat_obs',
+                     'avg_area', 'max_area', 'min_area']
+    
+    return centroids_df.merge(stats[stats_columns], left_on='loc', right_index=True)
 
 # ==================== FUNCIONES DE VISUALIZACIÓN ====================
 
-def create_world_map(locations_df, selected_loc=None):
+MAP_DENSITY_CELL_DEG = 0.5
+
+@st.cache_data(max_entries=32, ttl=600)
+def create_world_map(locations_df):
     """Crea mapa mundial interactivo con Plotly"""
     
     fig = go.Figure()
     
-    # Añadir marcadores para todas las ubicaciones
-    fig.add_trace(go.Scattergeo(
+    # Opacidad según la densidad local: celdas de MAP_DENSITY_CELL_DEG grados
+    cells = np.floor(locations_df[['lon', 'lat']].to_numpy() / MAP_DENSITY_CELL_DEG).astype(np.int64)
+    _, inverse, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    opacity = np.clip(0.9 / np.sqrt(counts[inverse.ravel()]), 0.3, 0.9)
+    
+    # Añadir marcadores para todas las ubicaciones (WebGL)
+    fig.add_trace(go.Scattermap(
         lon=locations_df['lon'],
         lat=locations_df['lat'],
         text=locations_df['ram_name'],
@@ -192,8 +335,7 @@ def create_world_map(locations_df, selected_loc=None):
         marker=dict(
             size=10,
             color='blue',
-            line=dict(width=1, color='white'),
-            opacity=0.7
+            opacity=opacity
         ),
         customdata=locations_df[['loc', 'ram_name', 'total_observations', 'avg_area']],
         hovertemplate='<b>%{customdata[1]}</b><br>' +
@@ -204,23 +346,18 @@ def create_world_map(locations_df, selected_loc=None):
         name='Ubicaciones'
     ))
     
-    # Resaltar ubicación seleccionada
-    if selected_loc is not None:
-        selected_data = locations_df[locations_df['loc'] == selected_loc]
-        if not selected_data.empty:
-            fig.add_trace(go.Scattergeo(
-                lon=selected_data['lon'],
-                lat=selected_data['lat'],
-                mode='markers',
-                marker=dict(
-                    size=20,
-                    color='red',
-                    symbol='star',
-                    line=dict(width=2, color='white')
-                ),
-                name='Ubicación Seleccionada',
-                showlegend=True
-            ))
+    # Marcador de la ubicación seleccionada, vacío en el mapa base (ver highlight_location)
+    fig.add_trace(go.Scattermap(
+        lon=[],
+        lat=[],
+        mode='markers',
+        marker=dict(
+            size=20,
+            color='red'
+        ),
+        name='Ubicación Seleccionada',
+        showlegend=False
+    ))
     
     # Configurar el layout del mapa
     fig.update_layout(
@@ -230,35 +367,63 @@ def create_world_map(locations_df, selected_loc=None):
             'xanchor': 'center',
             'font': {'size': 24, 'color': '#1f77b4', 'family': 'Arial Black'}
         },
-        geo=dict(
-            projection_type='natural earth',
-            showland=True,
-            landcolor='rgb(243, 243, 243)',
-            coastlinecolor='rgb(204, 204, 204)',
-            showocean=True,
-            oceancolor='rgb(230, 245, 255)',
-            showcountries=True,
-            countrycolor='rgb(204, 204, 204)',
-            showlakes=True,
-            lakecolor='rgb(200, 230, 255)',
+        map=dict(
+            style='carto-positron',
+            center=dict(lat=locations_df['lat'].mean(), lon=locations_df['lon'].mean()),
+            zoom=4
         ),
         height=600,
-        margin=dict(l=0, r=0, t=80, b=0)
+        margin=dict(l=0, r=0, t=80, b=0),
+        # Conserva zoom y desplazamiento del usuario entre reruns
+        uirevision='ramsar_map'
     )
     
     return fig
 
-def create_time_series_chart(data_df, loc_id):
+def highlight_location(fig, locations_df, selected_loc):
+    """Sitúa el marcador de la ubicación seleccionada en una copia del mapa cacheado"""
+    # st.cache_data devuelve una copia nueva del mapa base en cada llamada; solo se
+    # actualiza la traza existente para que el navegador conserve el resto del mapa
+    selected_data = locations_df[locations_df['loc'] == selected_loc]
+    if not selected_data.empty:
+        fig.update_traces(
+            lon=selected_data['lon'],
+            lat=selected_data['lat'],
+            showlegend=True,
+            selector=dict(name='Ubicación Seleccionada')
+        )
+    
+    return fig
+
+TIME_SERIES_MAX_POINTS = 500
+
+def downsample_series(series_data, columns):
+    """Promedia por semana una serie con más de TIME_SERIES_MAX_POINTS puntos"""
+    if len(series_data) <= TIME_SERIES_MAX_POINTS:
+        return series_data, False
+    
+    weekly = series_data.set_index('time')[columns].resample('W').mean().dropna(how='all')
+    return weekly.reset_index(), True
+
+@st.cache_data(max_entries=32, ttl=600)
+def create_time_series_chart(loc_id, date_range, sat_filter, high_resolution=False):
     """Crea gráfico de series temporales con tres líneas"""
     
-    loc_data = data_df[data_df['loc'] == loc_id].copy()
+    loc_data = get_location_data(loc_id, date_range, sat_filter)
     
     if loc_data.empty:
         return None
     
-    # Preparar datos para las tres líneas
-    sentinel1_data = loc_data[loc_data['sat_id'] == 'S1_GRD'].sort_values('time')
-    landsat_data = loc_data[loc_data['sat_id'] != 'S1_GRD'].sort_values('time')
+    # Preparar datos para las tres líneas (ya ordenados por tiempo desde SQL)
+    sentinel1_data, landsat_data = split_by_satellite(loc_data)
+    
+    # Series largas: promedios semanales salvo que se pida alta resolución
+    s1_resampled = ls_resampled = False
+    if not high_resolution:
+        sentinel1_data, s1_resampled = downsample_series(sentinel1_data, ['area_km2'])
+        landsat_data, ls_resampled = downsample_series(landsat_data, ['area_km2', 'ndwi_area_km2'])
+    s1_suffix = ', promedio semanal' if s1_resampled else ''
+    ls_suffix = ', promedio semanal' if ls_resampled else ''
     
     # Crear figura
     fig = go.Figure()
@@ -269,7 +434,7 @@ def create_time_series_chart(data_df, loc_id):
             x=sentinel1_data['time'],
             y=sentinel1_data['area_km2'],
             mode='lines+markers',
-            name='Sentinel-1 (Área SAR)',
+            name=f'Sentinel-1 (Área SAR{s1_suffix})',
             line=dict(color='#3498db', width=2),
             marker=dict(size=6),
             hovertemplate='<b>Sentinel-1</b><br>' +
@@ -284,7 +449,7 @@ def create_time_series_chart(data_df, loc_id):
             x=landsat_data['time'],
             y=landsat_data['area_km2'],
             mode='lines+markers',
-            name='Landsat (Área NIR)',
+            name=f'Landsat (Área NIR{ls_suffix})',
             line=dict(color='#e74c3c', width=2),
             marker=dict(size=6),
             hovertemplate='<b>Landsat - NIR</b><br>' +
@@ -299,7 +464,7 @@ def create_time_series_chart(data_df, loc_id):
             x=landsat_data['time'],
             y=landsat_data['ndwi_area_km2'],
             mode='lines+markers',
-            name='Landsat (Área NDWI)',
+            name=f'Landsat (Área NDWI{ls_suffix})',
             line=dict(color='#2ecc71', width=2),
             marker=dict(size=6),
             hovertemplate='<b>Landsat - NDWI</b><br>' +
@@ -341,48 +506,50 @@ def create_time_series_chart(data_df, loc_id):
     
     return fig
 
-def create_statistics_cards(data_df, loc_id):
+@st.cache_data(max_entries=32, ttl=600)
+def create_statistics_cards(loc_id, date_range, sat_filter):
     """Crea tarjetas de estadísticas para una ubicación"""
     
-    loc_data = data_df[data_df['loc'] == loc_id]
+    loc_data = get_location_data(loc_id, date_range, sat_filter)
     
     if loc_data.empty:
-        return None, None, None, None
+        return None
     
-    sentinel1_data = loc_data[loc_data['sat_id'] == 'S1_GRD']
-    landsat_data = loc_data[loc_data['sat_id'] != 'S1_GRD']
+    # Estadísticas de ambos sensores en una sola agrupación (True: Sentinel-1, False: Landsat)
+    agg = loc_data.groupby((loc_data['sat_id'] == 'S1_GRD').rename('is_s1')).agg(
+        obs=('area_km2', 'size'),
+        avg=('area_km2', 'mean'),
+        max=('area_km2', 'max'),
+        min=('area_km2', 'min'),
+        ndwi_avg=('ndwi_area_km2', 'mean'),
+        ndwi_max=('ndwi_area_km2', 'max'),
+        ndwi_min=('ndwi_area_km2', 'min')
+    ).reindex([True, False], fill_value=0)
+    sentinel1_stats = agg.loc[True]
+    landsat_stats = agg.loc[False]
     
     # Estadísticas generales
     total_obs = len(loc_data)
-    date_range = f"{loc_data['time'].min().strftime('%Y-%m-%d')} - {loc_data['time'].max().strftime('%Y-%m-%d')}"
+    # Observaciones ordenadas por tiempo: la primera y la última delimitan el rango
+    time_min = loc_data['time'].iloc[0]
+    time_max = loc_data['time'].iloc[-1]
+    date_range_text = f"{time_min.strftime('%Y-%m-%d')} - {time_max.strftime('%Y-%m-%d')}"
+    days = (time_max - time_min).days
     
     # Estadísticas Sentinel-1
-    if not sentinel1_data.empty:
-        s1_avg = sentinel1_data['area_km2'].mean()
-        s1_max = sentinel1_data['area_km2'].max()
-        s1_min = sentinel1_data['area_km2'].min()
-        s1_obs = len(sentinel1_data)
-    else:
-        s1_avg = s1_max = s1_min = s1_obs = 0
+    s1_obs = int(sentinel1_stats['obs'])
+    s1_avg, s1_max, s1_min = sentinel1_stats[['avg', 'max', 'min']]
     
     # Estadísticas Landsat
-    if not landsat_data.empty:
-        ls_avg = landsat_data['area_km2'].mean()
-        ls_max = landsat_data['area_km2'].max()
-        ls_min = landsat_data['area_km2'].min()
-        ls_obs = len(landsat_data)
-        
-        ndwi_avg = landsat_data['ndwi_area_km2'].mean()
-        ndwi_max = landsat_data['ndwi_area_km2'].max()
-        ndwi_min = landsat_data['ndwi_area_km2'].min()
-    else:
-        ls_avg = ls_max = ls_min = ls_obs = 0
-        ndwi_avg = ndwi_max = ndwi_min = 0
+    ls_obs = int(landsat_stats['obs'])
+    ls_avg, ls_max, ls_min = landsat_stats[['avg', 'max', 'min']]
+    ndwi_avg, ndwi_max, ndwi_min = landsat_stats[['ndwi_avg', 'ndwi_max', 'ndwi_min']]
     
     return {
         'general': {
             'total_obs': total_obs,
-            'date_range': date_range,
+            'date_range': date_range_text,
+            'days': days,
             's1_obs': s1_obs,
             'ls_obs': ls_obs
         },
@@ -405,11 +572,12 @@ def create_statistics_cards(data_df, loc_id):
         }
     }
 
-def create_comparison_chart(data_df, loc_id):
+@st.cache_data(max_entries=32, ttl=600)
+def create_comparison_chart(loc_id, date_range, sat_filter):
     """Crea gráfico de comparación entre métodos"""
     
-    loc_data = data_df[data_df['loc'] == loc_id]
-    landsat_data = loc_data[loc_data['sat_id'] != 'S1_GRD']
+    loc_data = get_location_data(loc_id, date_range, sat_filter)
+    _, landsat_data = split_by_satellite(loc_data)
     
     if landsat_data.empty:
         return None
@@ -440,12 +608,13 @@ def create_comparison_chart(data_df, loc_id):
             mode='markers',
             marker=dict(
                 size=8,
-                color=landsat_data['time'].astype(np.int64),
+                # Días desde 1970 en int32: mismo orden de color con la mitad de bytes
+                color=landsat_data['time'].values.astype('datetime64[D]').astype(np.int32),
                 colorscale='Viridis',
                 showscale=True,
                 colorbar=dict(title="Tiempo")
             ),
-            text=landsat_data['time'].dt.strftime('%Y-%m-%d'),
+            text=np.datetime_as_string(landsat_data['time'].values, unit='D'),
             hovertemplate='<b>Fecha: %{text}</b><br>' +
                           'NDWI: %{x:.2f} km²<br>' +
                           'Clasificación: %{y:.2f} km²<br>' +
@@ -483,21 +652,27 @@ def create_comparison_chart(data_df, loc_id):
     
     return fig
 
-def create_monthly_analysis(data_df, loc_id):
+@st.cache_data(max_entries=32, ttl=600)
+def create_monthly_analysis(loc_id, date_range, sat_filter):
     """Crea análisis por mes"""
     
-    loc_data = data_df[data_df['loc'] == loc_id].copy()
+    loc_data = get_location_data(loc_id, date_range, sat_filter)
     
     if loc_data.empty:
         return None
     
-    loc_data['month'] = loc_data['time'].dt.month
-    loc_data['month_name'] = loc_data['time'].dt.strftime('%B')
+    # Agrupar por mes y sensor en una sola pasada
+    monthly = loc_data.groupby(
+        [loc_data['time'].dt.month.rename('month'), (loc_data['sat_id'] == 'S1_GRD').rename('is_s1')]
+    ).agg(
+        area=('area_km2', 'mean'),
+        ndwi=('ndwi_area_km2', 'mean')
+    ).unstack('is_s1')
+    monthly = monthly.reindex(columns=pd.MultiIndex.from_product([['area', 'ndwi'], [True, False]]))
     
-    # Agrupar por mes
-    sentinel1_monthly = loc_data[loc_data['sat_id'] == 'S1_GRD'].groupby('month')['area_km2'].mean()
-    landsat_monthly = loc_data[loc_data['sat_id'] != 'S1_GRD'].groupby('month')['area_km2'].mean()
-    ndwi_monthly = loc_data[loc_data['sat_id'] != 'S1_GRD'].groupby('month')['ndwi_area_km2'].mean()
+    sentinel1_monthly = monthly[('area', True)].dropna()
+    landsat_monthly = monthly[('area', False)].dropna()
+    ndwi_monthly = monthly[('ndwi', False)].dropna()
     
     months = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
               'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
@@ -507,7 +682,7 @@ def create_monthly_analysis(data_df, loc_id):
     if not sentinel1_monthly.empty:
         fig.add_trace(go.Bar(
             x=[months[i-1] for i in sentinel1_monthly.index],
-            y=sentinel1_monthly.values,
+            y=sentinel1_monthly.values.astype(np.float32),
             name='Sentinel-1 (VV, VH)',
             marker_color='#3498db'
         ))
@@ -515,7 +690,7 @@ def create_monthly_analysis(data_df, loc_id):
     if not landsat_monthly.empty:
         fig.add_trace(go.Bar(
             x=[months[i-1] for i in landsat_monthly.index],
-            y=landsat_monthly.values,
+            y=landsat_monthly.values.astype(np.float32),
             name='Landsat (NIR)',
             marker_color='#e74c3c'
         ))
@@ -523,7 +698,7 @@ def create_monthly_analysis(data_df, loc_id):
     if not ndwi_monthly.empty:
         fig.add_trace(go.Bar(
             x=[months[i-1] for i in ndwi_monthly.index],
-            y=ndwi_monthly.values,
+            y=ndwi_monthly.values.astype(np.float32),
             name='Landsat (NDWI)',
             marker_color='#2ecc71'
         ))
@@ -539,6 +714,33 @@ def create_monthly_analysis(data_df, loc_id):
     
     return fig
 
+def get_world_map(locations_df, selected_loc=None):
+    """Devuelve el mapa (resaltando selected_loc), reutilizando el de la sesión si la selección no cambia"""
+    # Cambiar el método de selección con 'Todas' activo no vuelve a copiar el mapa cacheado
+    if st.session_state.get('last_map_key') != selected_loc or 'cached_map' not in st.session_state:
+        world_map = create_world_map(locations_df)
+        if selected_loc is not None:
+            world_map = highlight_location(world_map, locations_df, selected_loc)
+        st.session_state['cached_map'] = world_map
+        st.session_state['last_map_key'] = selected_loc
+    
+    return st.session_state['cached_map']
+
+def get_location_figures(loc_id, date_range, sat_filter, high_resolution):
+    """Devuelve las figuras de la vista detallada, reutilizando las de la sesión si los filtros no cambian"""
+    render_key = (loc_id, date_range, sat_filter, high_resolution)
+    
+    # Reruns que no cambian los filtros (p. ej. cambiar el método de selección) no reconstruyen nada
+    if st.session_state.get('last_render_key') != render_key:
+        st.session_state['cached_figures'] = {
+            'time_series': create_time_series_chart(loc_id, date_range, sat_filter, high_resolution),
+            'comparison': create_comparison_chart(loc_id, date_range, sat_filter),
+            'monthly': create_monthly_analysis(loc_id, date_range, sat_filter)
+        }
+        st.session_state['last_render_key'] = render_key
+    
+    return st.session_state['cached_figures']
+
 # ==================== APLICACIÓN PRINCIPAL ====================
 
 def main():
@@ -549,16 +751,26 @@ def main():
     
     # Cargar datos
     with st.spinner('🔄 Cargando datos...'):
-        data_df = load_database()
-        geometries = load_geometries()
+        summary_df = load_locations_summary()
+        centroids_df = load_centroids()
+        
+        # Sin centroides precalculados: se calculan a partir de las geometrías
+        if centroids_df.empty:
+            geometries = load_geometries()
+            if geometries:
+                centroids_df = compute_centroids(geometries)
         
-        if data_df.empty or not geometries:
+        if summary_df.empty or centroids_df.empty:
             st.error("❌ No se pudieron cargar los datos. Verifica las rutas de los archivos.")
             return
         
-        locations_df = create_locations_dataframe(geometries, data_df)
+        locations_df = create_locations_dataframe(centroids_df, summary_df)
     
-    st.success(f'✅ Datos cargados: {len(locations_df)} ubicaciones, {len(data_df)} observaciones')
+    total_observations = summary_df['n_obs'].sum()
+    min_time = summary_df['time_min'].min()
+    max_time = summary_df['time_max'].max()
+    
+    st.success(f'✅ Datos cargados: {len(locations_df)} ubicaciones, {total_observations} observaciones')
     
     # Sidebar
     with st.sidebar:
@@ -634,16 +846,15 @@ def main():
         st.subheader("🔍 Filtros")
         
         # Filtro de fecha
-        if not data_df.empty:
-            min_date = data_df['time'].min().date()
-            max_date = data_df['time'].max().date()
-            
-            date_range = st.date_input(
-                "Rango de fechas:",
-                value=(min_date, max_date),
-                min_value=min_date,
-                max_value=max_date
-            )
+        min_date = min_time.date()
+        max_date = max_time.date()
+        
+        date_range = st.date_input(
+            "Rango de fechas:",
+            value=(min_date, max_date),
+            min_value=min_date,
+            max_value=max_date
+        )
         
         # Filtro de satélite
         sat_filter = st.multiselect(
@@ -659,24 +870,20 @@ def main():
         st.info(
             f"""
             **Total de ubicaciones:** {len(locations_df)}  
-            **Total de observaciones:** {len(data_df)}  
-            **Rango temporal:** {data_df['time'].min().strftime('%Y-%m-%d')} a {data_df['time'].max().strftime('%Y-%m-%d')}
+            **Total de observaciones:** {total_observations}  
+            **Rango temporal:** {min_time.strftime('%Y-%m-%d')} a {max_time.strftime('%Y-%m-%d')}
             """
         )
     
     # Aplicar filtros
-    filtered_df = data_df.copy()
-    
     if len(date_range) == 2:
-        filtered_df = filtered_df[
-            (filtered_df['time'].dt.date >= date_range[0]) &
-            (filtered_df['time'].dt.date <= date_range[1])
-        ]
+        d0, d1 = date_range
+    else:
+        d0, d1 = min_date, max_date
     
-    if 'Sentinel-1' not in sat_filter:
-        filtered_df = filtered_df[filtered_df['sat_id'] != 'S1_GRD']
-    if 'Landsat' not in sat_filter:
-        filtered_df = filtered_df[filtered_df['sat_id'] == 'S1_GRD']
+    # Claves hashables para los gráficos cacheados
+    date_key = (d0, d1)
+    sat_key = tuple(sat_filter)
     
     # Contenido principal
     if selected_loc == 'Todas':
@@ -684,8 +891,8 @@ def main():
         st.header("🗺️ Vista General Localizaciones Ramsar")
         
         # Mapa mundial
-        world_map = create_world_map(locations_df)
-        st.plotly_chart(world_map, use_container_width=True)
+        world_map = get_world_map(locations_df)
+        st.plotly_chart(world_map, use_container_width=True, key='ramsar_map')
         
         # Estadísticas globales
         col1, col2, col3, col4 = st.columns(4)
@@ -697,15 +904,19 @@ def main():
                 delta=None
             )
         
+        # Conteos del rango sobre la tabla diaria precalculada, sin tocar las observaciones
+        counts = load_daily_counts().loc[pd.Timestamp(d0):pd.Timestamp(d1)].sum()
+        sentinel1_count = counts['sentinel1_obs'] if 'Sentinel-1' in sat_filter else 0
+        landsat_count = counts['landsat_obs'] if 'Landsat' in sat_filter else 0
+        
         with col2:
             st.metric(
                 "📊 Observaciones Totales",
-                f"{len(filtered_df):,}",
+                f"{sentinel1_count + landsat_count:,}",
                 delta=None
             )
         
         with col3:
-            sentinel1_count = len(filtered_df[filtered_df['sat_id'] == 'S1_GRD'])
             st.metric(
                 "🛰️ Observaciones Sentinel-1",
                 f"{sentinel1_count:,}",
@@ -713,7 +924,6 @@ def main():
             )
         
         with col4:
-            landsat_count = len(filtered_df[filtered_df['sat_id'] != 'S1_GRD'])
             st.metric(
                 "🛰️ Observaciones Landsat",
                 f"{landsat_count:,}",
@@ -758,11 +968,11 @@ def main():
             st.header(f"📍 Análisis Detallado - Ubicación {selected_loc}")
         
         # Mapa con ubicación seleccionada
-        world_map = create_world_map(locations_df, selected_loc)
-        st.plotly_chart(world_map, use_container_width=True)
+        world_map = get_world_map(locations_df, selected_loc)
+        st.plotly_chart(world_map, use_container_width=True, key='ramsar_map')
         
         # Obtener estadísticas
-        stats = create_statistics_cards(filtered_df, selected_loc)
+        stats = create_statistics_cards(selected_loc, date_key, sat_key)
         
         if stats:
             # Métricas principales
@@ -790,7 +1000,7 @@ def main():
             with col4:
                 st.metric(
                     "📆 Rango Temporal",
-                    f"{stats['general']['total_obs']} días"
+                    f"{stats['general']['days']} días"
                 )
             
             st.markdown("---")
@@ -831,7 +1041,14 @@ def main():
             
             # Gráfico de series temporales
             st.subheader("📈 Series Temporales")
-            time_series_fig = create_time_series_chart(filtered_df, selected_loc)
+            high_resolution = st.toggle(
+                "🔎 Alta resolución",
+                value=False,
+                help=f"Muestra todas las observaciones; por defecto las series con más de {TIME_SERIES_MAX_POINTS} puntos se promedian por semana"
+            )
+            figures = get_location_figures(selected_loc, date_key, sat_key, high_resolution)
+            
+            time_series_fig = figures['time_series']
             if time_series_fig:
                 st.plotly_chart(time_series_fig, use_container_width=True)
             else:
@@ -841,7 +1058,7 @@ def main():
             
             # Análisis comparativo
             st.subheader("🔬 Análisis Comparativo")
-            comparison_fig = create_comparison_chart(filtered_df, selected_loc)
+            comparison_fig = figures['comparison']
             if comparison_fig:
                 st.plotly_chart(comparison_fig, use_container_width=True)
             else:
@@ -851,7 +1068,7 @@ def main():
             
             # Análisis mensual
             st.subheader("📅 Análisis Estacional")
-            monthly_fig = create_monthly_analysis(filtered_df, selected_loc)
+            monthly_fig = figures['monthly']
             if monthly_fig:
                 st.plotly_chart(monthly_fig, use_container_width=True)
             else:
@@ -0,0 +1,40 @@
+"""
+Precálculo de los centroides de las ubicaciones del dashboard
+Genera data/centroids.parquet (loc, ram_name, lat, lon) a partir de geometries/
+
+Uso (desde app_dashboard/):
+    python scripts/build_centroids.py
+
+Volver a ejecutar cuando se añadan o modifiquen geometrías. Las estadísticas de
+cada ubicación se siguen calculando en el dashboard a partir de db_1.db.
+"""
+
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.py resuelve geometries/ desde el directorio de trabajo
+os.chdir(APP_DIR)
+sys.path.insert(0, APP_DIR)
+
+from app import load_geometries, compute_centroids
+
+
+def main():
+    geometries = load_geometries()
+
+    if not geometries:
+        sys.exit("❌ No se pudieron cargar las geometrías. Verifica la ruta de geometries/.")
+
+    centroids_df = compute_centroids(geometries)
+
+    output_path = os.path.join(APP_DIR, 'data', 'centroids.parquet')
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    centroids_df.to_parquet(output_path, index=False)
+
+    print(f"✅ {len(centroids_df)} centroides guardados en {output_path}")
+
+
+if __name__ == "__main__":
+    main()